@@ -0,0 +1,202 @@
+"""
+متریک‌های Prometheus بدون وابستگی خارجی
+
+شمارنده، هیستوگرام و gauge ساده با خروجی text exposition format نسخه‌ی 0.0.4.
+به‌روزرسانی هر متریک فقط یک جست‌وجوی دیکشنری و یک bisect است تا روی هر
+درخواست در محیط اصلی هم روشن بماند. میدل‌ور ASGI زمان هر درخواست را با الگوی
+مسیر (نه آدرس واقعی) ثبت می‌کند تا تعداد سری‌ها محدود بماند.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Response خودش charset=utf-8 را اضافه می‌کند
+CONTENT_TYPE = "text/plain; version=0.0.4"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # observe از thread نوشتن کانفیگ Xray هم صدا زده می‌شود
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def collect(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+            for labels, value in sorted(self.values.items())
+        ]
+
+class Gauge(_Metric):
+    """مقدار لحظه‌ای؛ با set یا با تابع callback که هنگام scrape صدا زده می‌شود"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), callback: Optional[Callable] = None):
+        super().__init__(name, help, labels)
+        self.values: Dict[Tuple, float] = {}
+        # callback: عدد، یا {تاپل برچسب‌ها: عدد}
+        self.callback = callback
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def replace(self, values: Dict[Tuple, float]):
+        """جایگزینی همه‌ی سری‌ها (برای برچسب‌هایی مثل نود که ممکن است حذف شوند)"""
+        self.values = dict(values)
+
+    def collect(self) -> List[str]:
+        values = self.values
+        if self.callback is not None:
+            result = self.callback()
+            values = result if isinstance(result, dict) else {(): result}
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+            for labels, value in sorted(values.items()) if value is not None
+        ]
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # برای هر سری: شمارش غیرتجمعی هر bucket (آخری +Inf) و مجموع
+        self.series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            suffix = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{suffix} {total!r}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self.metrics: List[_Metric] = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(self.prefix + name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (), callback: Optional[Callable] = None) -> Gauge:
+        return self._add(Gauge(self.prefix + name, help, labels, callback))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(self.prefix + name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.collect()
+        return "\n".join(lines) + "\n"
+
+# آمار SQL درخواست جاری: [تعداد کوئری، ثانیه]؛ SQLAlchemy رویدادها را در همان context اجرا می‌کند
+current_sql: contextvars.ContextVar = contextvars.ContextVar("current_sql", default=None)
+
+class MetricsMiddleware:
+    """
+    میدل‌ور ASGI برای تعداد، وضعیت و زمان درخواست‌ها به تفکیک الگوی مسیر
+
+    الگوی مسیر بعد از مسیریابی از endpoint داخل scope پیدا می‌شود؛ درخواست‌هایی
+    که به هیچ مسیری نخورند با برچسب "unmatched" ثبت می‌شوند.
+    """
+
+    def __init__(self, app, requests: Counter, latency: Histogram,
+                 sql_queries: Optional[Histogram] = None, sql_seconds: Optional[Counter] = None):
+        self.app = app
+        self.requests = requests
+        self.latency = latency
+        self.sql_queries = sql_queries
+        self.sql_seconds = sql_seconds
+        self._routes: Optional[Dict] = None
+
+    def _route_path(self, scope) -> str:
+        if self._routes is None:
+            router = scope.get("router")
+            self._routes = {
+                route.endpoint: route.path
+                for route in getattr(router, "routes", []) if hasattr(route, "endpoint")
+            }
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        sql = [0, 0.0]
+        token = current_sql.set(sql)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_sql.reset(token)
+            route = self._route_path(scope)
+            method = scope["method"]
+            self.requests.inc(method, route, str(status))
+            self.latency.observe(elapsed, method, route)
+            if self.sql_queries is not None:
+                self.sql_queries.observe(sql[0], method, route)
+                self.sql_seconds.inc(method, route, amount=sql[1])
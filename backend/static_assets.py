@@ -0,0 +1,167 @@
+"""
+سرو فایل‌های استاتیک frontend از حافظه
+
+فایل‌ها هنگام شروع یک بار خوانده می‌شوند و نسخه‌های gzip و brotli (در صورت
+نصب بودن بسته‌ی brotli) از قبل ساخته می‌شوند. هر فایل غیر HTML یک آدرس
+هش‌دار (/static/style.<hash>.css) دارد که با Cache-Control طولانی سرو می‌شود و
+ارجاع‌های صفحات HTML به همین آدرس‌ها بازنویسی می‌شوند. HTMLها با ETag و
+no-cache سرو می‌شوند تا مرورگر با یک 304 بدون بدنه اعتبارسنجی کند.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# فایل‌های کوچک‌تر از این فشرده نمی‌شوند
+MIN_COMPRESS_SIZE = 256
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+# ارجاع‌های href/src نسبی یا با پیشوند / و /static/
+_REFERENCE = re.compile(r'(href|src)="(?:/static/|/)?([\w./-]+)"')
+
+class StaticAsset:
+    """یک فایل با نسخه‌های فشرده و ETag"""
+
+    def __init__(self, name: str, body: bytes):
+        self.name = name
+        # Response برای text/* خودش charset=utf-8 اضافه می‌کند
+        self.content_type = content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.hash = hashlib.sha256(body).hexdigest()[:12]
+        # یک ETag ضعیف برای همه‌ی کدگذاری‌ها؛ محتوای آن‌ها یکی است
+        self.etag = f'W/"{self.hash}"'
+        self.variants: Dict[str, bytes] = {"identity": body}
+        if len(body) >= MIN_COMPRESS_SIZE and content_type.startswith(COMPRESSIBLE):
+            self.variants["gzip"] = gzip.compress(body, 9, mtime=0)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(body, quality=11)
+
+    @property
+    def hashed_name(self) -> str:
+        stem, ext = os.path.splitext(self.name)
+        return f"{stem}.{self.hash}{ext}"
+
+class StaticAssets:
+    """
+    مخزن فایل‌های استاتیک یک پوشه
+
+    با watch=True (حالت توسعه) زمان تغییر فایل‌ها هر ثانیه بررسی می‌شود و در
+    صورت تغییر همه‌چیز دوباره ساخته می‌شود.
+    """
+
+    WATCH_INTERVAL = 1.0
+
+    def __init__(self, directory: str, watch: bool = False):
+        self.directory = directory
+        self.watch = watch
+        self.assets: Dict[str, StaticAsset] = {}
+        self._hashed: Dict[str, StaticAsset] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._task = None
+
+    def _scan(self) -> Dict[str, float]:
+        mtimes = {}
+        if not os.path.isdir(self.directory):
+            return mtimes
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                mtimes[os.path.relpath(path, self.directory).replace(os.sep, "/")] = os.path.getmtime(path)
+        return mtimes
+
+    def load(self):
+        """خواندن همه‌ی فایل‌ها، ساخت نسخه‌های فشرده و بازنویسی ارجاع‌های HTML"""
+        mtimes = self._scan()
+        raw = {}
+        for name in mtimes:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                raw[name] = f.read()
+        assets = {name: StaticAsset(name, body) for name, body in raw.items() if not name.endswith(".html")}
+
+        def hashed_url(match):
+            asset = assets.get(match.group(2))
+            if asset is None:
+                return match.group(0)
+            return f'{match.group(1)}="/static/{asset.hashed_name}"'
+
+        for name, body in raw.items():
+            if name.endswith(".html"):
+                assets[name] = StaticAsset(name, _REFERENCE.sub(hashed_url, body.decode()).encode())
+        self.assets = assets
+        self._hashed = {asset.hashed_name: asset for asset in assets.values() if not asset.name.endswith(".html")}
+        self._mtimes = mtimes
+
+    def lookup(self, name: str) -> Tuple[Optional[StaticAsset], bool]:
+        """پیدا کردن فایل با نام ساده یا هش‌دار؛ مقدار دوم یعنی آدرس هش‌دار بوده است"""
+        asset = self._hashed.get(name)
+        if asset is not None:
+            return asset, True
+        return self.assets.get(name), False
+
+    def response(self, name: str, headers, immutable: bool = False) -> Optional[Response]:
+        """پاسخ با بهترین کدگذاری پذیرفته‌شده یا 304؛ None اگر فایل وجود نداشته باشد"""
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+        response_headers = {
+            "ETag": asset.etag,
+            "Cache-Control": IMMUTABLE if immutable else REVALIDATE,
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and asset.etag.removeprefix("W/") in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]:
+            return Response(status_code=304, headers=response_headers)
+
+        encoding = negotiate_encoding(headers.get("accept-encoding", ""), asset.variants)
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        return Response(asset.variants[encoding], media_type=asset.content_type, headers=response_headers)
+
+    def start(self):
+        self.load()
+        if self.watch:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.WATCH_INTERVAL)
+            try:
+                if self._scan() != self._mtimes:
+                    self.load()
+            except OSError:
+                # فایل در حال نوشته شدن است؛ دور بعد دوباره بررسی می‌شود
+                pass
+
+def negotiate_encoding(accept_encoding: str, variants: Dict[str, bytes]) -> str:
+    """انتخاب br یا gzip بر اساس Accept-Encoding (کدگذاری‌های q=0 کنار گذاشته می‌شوند)"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip())
+    for encoding in ("br", "gzip"):
+        if encoding in variants and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
@@ -0,0 +1,172 @@
+"""
+تست کلاینت API هسته‌ی Xray و مسیر نودها با StubXrayServer
+
+Xray محلی و نودها هر کدام یک StubXrayServer روی پورت محلی هستند، پس تست‌ها
+به Xray واقعی یا systemctl نیاز ندارند. برنامه با lifespan خودش روی یک دیتابیس
+موقت بالا می‌آید و با httpx.ASGITransport فراخوانی می‌شود.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from xray_api import StubXrayServer, XrayAPI  # noqa: E402
+
+def free_address() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{sock.getsockname()[1]}"
+
+@pytest.fixture(scope="module")
+def main():
+    """ماژول main با دیتابیس و کانفیگ Xray موقت؛ تنظیمات هنگام import خوانده می‌شوند"""
+    workdir = tempfile.mkdtemp(prefix="server24-test-")
+    config_path = os.path.join(workdir, "config.json")
+    with open(config_path, "w") as f:
+        json.dump({"inbounds": [{"tag": "vless-in", "protocol": "vless", "settings": {"clients": []}}]}, f)
+    os.environ.update(
+        DATABASE_PATH=os.path.join(workdir, "server24.db"),
+        XRAY_CONFIG_PATH=config_path,
+        XRAY_PROVISIONER="api",
+        XRAY_API_ADDR=free_address(),
+        XRAY_STATS_INTERVAL="0",
+        XRAY_FLUSH_INTERVAL_MS="20",
+        NODE_TIMEOUT="1",
+        NODE_RETRIES="0",
+        FRONTEND_PATH=os.path.join(os.path.dirname(BACKEND_DIR), "frontend"),
+    )
+    import main
+    return main
+
+@asynccontextmanager
+async def running(main):
+    """برنامه به همراه Xray محلی stub"""
+    local = StubXrayServer(main.XRAY_API_ADDR)
+    await local.start()
+    try:
+        async with main.lifespan(main.app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                yield client, local
+    finally:
+        await local.stop()
+
+async def create_user(client, telegram_id: int) -> int:
+    response = await client.post("/api/users/register", params={"telegram_id": telegram_id})
+    return response.json()["user_id"]
+
+async def create_node(client, address: str, weight: int = 1) -> int:
+    response = await client.post("/api/admin/nodes", params={
+        "name": "node", "api_addr": address, "inbound_tag": "vless-in", "domain": "node.example", "weight": weight,
+    })
+    assert response.status_code == 200
+    return response.json()["node"]["id"]
+
+async def expire(main, config_id: int):
+    async with main.SessionLocal() as db:
+        await db.execute(
+            main.update(main.Config).where(main.Config.id == config_id)
+            .values(expire_date=datetime.utcnow() - timedelta(days=1))
+        )
+        await db.commit()
+
+def test_stub_add_remove_query_stats():
+    async def scenario():
+        stub = StubXrayServer()
+        api = XrayAPI(await stub.start(), timeout=2)
+        try:
+            await api.add_user("vless-in", "uuid-1", email="a@test", flow="xtls-rprx-vision")
+            # کاربر تکراری خطا نیست
+            await api.add_user("vless-in", "uuid-1", email="a@test")
+            assert stub.users["vless-in"] == {"a@test": {"id": "uuid-1", "flow": "xtls-rprx-vision"}}
+
+            stub.add_traffic("a@test", uplink=100, downlink=50)
+            assert await api.query_stats("user>>>a@test>>>") == {
+                "user>>>a@test>>>traffic>>>uplink": 100,
+                "user>>>a@test>>>traffic>>>downlink": 50,
+            }
+            await api.query_stats("user>>>", reset=True)
+            assert set((await api.query_stats("user>>>")).values()) == {0}
+
+            assert await api.remove_user("vless-in", email="a@test") is True
+            assert await api.remove_user("vless-in", email="a@test") is False
+            assert stub.users["vless-in"] == {}
+        finally:
+            await api.close()
+            await stub.stop()
+
+    asyncio.run(scenario())
+
+def test_node_backlog_drains_after_restart(main):
+    async def scenario():
+        address = free_address()
+        node = StubXrayServer(address)
+        await node.start()
+        async with running(main) as (client, local):
+            user_id = await create_user(client, 1001)
+            node_id = await create_node(client, address)
+            await node.stop()
+
+            created = (await client.post("/api/configs/create", params={"user_id": user_id})).json()
+            assert created["uuid"] in local.users["vless-in"]
+            async with main.SessionLocal() as db:
+                assert (await main.node_fanout.pending(db)).get(node_id)
+
+            node = StubXrayServer(address)
+            await node.start()
+            for _ in range(50):
+                if await main.node_fanout.drain(node_id):
+                    break
+                await asyncio.sleep(0.1)
+            assert created["uuid"] in node.users["vless-in"]
+            async with main.SessionLocal() as db:
+                assert not (await main.node_fanout.pending(db)).get(node_id)
+
+            assert (await client.delete(f"/api/admin/nodes/{node_id}")).status_code == 200
+        await node.stop()
+
+    asyncio.run(scenario())
+
+def test_node_weight_change_and_delete(main):
+    async def scenario():
+        node = StubXrayServer()
+        address = await node.start()
+        async with running(main) as (client, local):
+            user_id = await create_user(client, 1002)
+            node_id = await create_node(client, address)
+            configs = [(await client.post("/api/configs/create", params={"user_id": user_id})).json() for _ in range(3)]
+            assert {config["node_id"] for config in configs} == {node_id}
+
+            # نود با وزن صفر دیگر کانفیگ جدید نمی‌گیرد ولی حذف و انقضا باید کار کنند
+            assert (await client.post(f"/api/admin/nodes/{node_id}", params={"weight": 0})).status_code == 200
+            nodes = await client.get("/api/admin/nodes")
+            assert nodes.status_code == 200
+            assert (await client.post("/api/configs/create", params={"user_id": user_id})).json()["node_id"] is None
+
+            assert (await client.delete(f"/api/configs/{configs[0]['config_id']}")).status_code == 200
+            assert configs[0]["uuid"] not in node.users["vless-in"]
+            assert configs[0]["uuid"] not in local.users["vless-in"]
+
+            await expire(main, configs[1]["config_id"])
+            await main.expiry_scheduler.enforce()
+            assert configs[1]["uuid"] not in node.users["vless-in"]
+            assert configs[1]["uuid"] not in local.users["vless-in"]
+
+            assert (await client.delete(f"/api/admin/nodes/{node_id}")).status_code == 200
+            assert (await client.get("/api/admin/nodes")).status_code == 200
+            assert (await client.delete(f"/api/configs/{configs[2]['config_id']}")).status_code == 200
+            assert configs[2]["uuid"] not in local.users["vless-in"]
+            assert (await client.post("/api/configs/create", params={"user_id": user_id})).status_code == 200
+        await node.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,256 @@
+"""
+کلاینت سبک gRPC برای API هسته‌ی Xray
+
+پیام‌های protobuf مورد نیاز به‌صورت دستی کدگذاری می‌شوند تا به stubهای
+تولیدشده از فایل‌های proto نیازی نباشد. یک سرور stub هم برای تست بدون
+Xray واقعی در همین فایل قرار دارد.
+"""
+
+import asyncio
+import grpc
+import grpc.aio
+from typing import Dict, List, Optional, Tuple
+
+HANDLER_SERVICE = "xray.app.proxyman.command.HandlerService"
+ALTER_INBOUND = f"/{HANDLER_SERVICE}/AlterInbound"
+STATS_SERVICE = "xray.app.stats.command.StatsService"
+QUERY_STATS = f"/{STATS_SERVICE}/QueryStats"
+
+ADD_USER_TYPE = "xray.app.proxyman.command.AddUserOperation"
+REMOVE_USER_TYPE = "xray.app.proxyman.command.RemoveUserOperation"
+VLESS_ACCOUNT_TYPE = "xray.proxy.vless.Account"
+
+class XrayAPIError(Exception):
+    """خطای فراخوانی API هسته‌ی Xray"""
+
+# کدگذاری protobuf
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _bytes_field(number: int, payload: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+def _string_field(number: int, value: str) -> bytes:
+    if not value:
+        return b""
+    return _bytes_field(number, value.encode())
+
+def _varint_field(number: int, value: int) -> bytes:
+    if not value:
+        return b""
+    return _varint(number << 3) + _varint(value)
+
+def _int64(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _typed_message(type_name: str, value: bytes) -> bytes:
+    return _string_field(1, type_name) + _bytes_field(2, value)
+
+def decode_message(data: bytes) -> Dict[int, List]:
+    """رمزگشایی یک پیام protobuf به {شماره‌ی فیلد: [مقادیر]}"""
+    fields: Dict[int, List] = {}
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        number, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire == 2:
+            length, pos = _read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        elif wire == 1:
+            value, pos = int.from_bytes(data[pos:pos + 8], "little"), pos + 8
+        elif wire == 5:
+            value, pos = int.from_bytes(data[pos:pos + 4], "little"), pos + 4
+        else:
+            raise ValueError(f"wire type پشتیبانی نمی‌شود: {wire}")
+        fields.setdefault(number, []).append(value)
+    return fields
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+def _first(fields: Dict[int, List], number: int, default=b""):
+    values = fields.get(number)
+    return values[0] if values else default
+
+def build_add_user(tag: str, uuid: str, email: str, flow: str = "", level: int = 0) -> bytes:
+    """AlterInboundRequest با عملیات AddUser برای یک کاربر VLESS"""
+    account = _string_field(1, uuid) + _string_field(2, flow) + _string_field(3, "none")
+    user = _varint_field(1, level) + _string_field(2, email) + _bytes_field(3, _typed_message(VLESS_ACCOUNT_TYPE, account))
+    operation = _typed_message(ADD_USER_TYPE, _bytes_field(1, user))
+    return _string_field(1, tag) + _bytes_field(2, operation)
+
+def build_remove_user(tag: str, email: str) -> bytes:
+    """AlterInboundRequest با عملیات RemoveUser"""
+    operation = _typed_message(REMOVE_USER_TYPE, _string_field(1, email))
+    return _string_field(1, tag) + _bytes_field(2, operation)
+
+def parse_alter_inbound(data: bytes) -> Dict[str, str]:
+    """تجزیه‌ی AlterInboundRequest (برای سرور stub)"""
+    request = decode_message(data)
+    operation = decode_message(_first(request, 2))
+    result = {"tag": _first(request, 1).decode(), "type": _first(operation, 1).decode()}
+    body = decode_message(_first(operation, 2))
+    if result["type"] == ADD_USER_TYPE:
+        user = decode_message(_first(body, 1))
+        account = decode_message(_first(decode_message(_first(user, 3)), 2))
+        result["email"] = _first(user, 2).decode()
+        result["uuid"] = _first(account, 1).decode()
+        result["flow"] = _first(account, 2).decode()
+    else:
+        result["email"] = _first(body, 1).decode()
+    return result
+
+def build_query_stats(pattern: str, reset: bool = False) -> bytes:
+    """QueryStatsRequest"""
+    return _string_field(1, pattern) + _varint_field(2, int(reset))
+
+def parse_query_stats(data: bytes) -> Dict[str, int]:
+    """تجزیه‌ی QueryStatsResponse به {نام شمارنده: مقدار}"""
+    result = {}
+    for stat in decode_message(data).get(1, []):
+        fields = decode_message(stat)
+        result[_first(fields, 1).decode()] = _int64(_first(fields, 2, 0))
+    return result
+
+def build_query_stats_response(stats: Dict[str, int]) -> bytes:
+    """QueryStatsResponse (برای سرور stub)"""
+    return b"".join(
+        _bytes_field(1, _string_field(1, name) + _varint_field(2, value & ((1 << 64) - 1)))
+        for name, value in stats.items()
+    )
+
+# کلاینت
+
+class XrayAPI:
+    """کلاینت API هسته‌ی Xray (HandlerService و StatsService)"""
+
+    def __init__(self, address: str, timeout: float = 5.0):
+        self.address = address
+        self.timeout = timeout
+        self._channel: Optional[grpc.aio.Channel] = None
+
+    def _call(self, method: str):
+        if self._channel is None:
+            self._channel = grpc.aio.insecure_channel(self.address)
+        # بدون serializer: پیام‌ها از قبل به بایت تبدیل شده‌اند
+        return self._channel.unary_unary(method)
+
+    async def _invoke(self, method: str, request: bytes, ignore: str = "") -> Optional[bytes]:
+        """None یعنی خطای ignore رخ داده و نادیده گرفته شده است"""
+        try:
+            return await self._call(method)(request, timeout=self.timeout)
+        except grpc.aio.AioRpcError as e:
+            details = e.details() or ""
+            if ignore and ignore in details.lower():
+                return None
+            raise XrayAPIError(f"{method}: {e.code().name} {details}") from e
+
+    async def add_user(self, tag: str, uuid: str, email: str, flow: str = "", level: int = 0):
+        """افزودن کاربر به inbound بدون ری‌لود؛ کاربر تکراری خطا حساب نمی‌شود"""
+        await self._invoke(ALTER_INBOUND, build_add_user(tag, uuid, email, flow, level), ignore="already exists")
+
+    async def remove_user(self, tag: str, email: str) -> bool:
+        """حذف کاربر از inbound بدون ری‌لود؛ کاربر ناموجود خطا حساب نمی‌شود و False برمی‌گرداند"""
+        return await self._invoke(ALTER_INBOUND, build_remove_user(tag, email), ignore="not found") is not None
+
+    async def query_stats(self, pattern: str, reset: bool = False) -> Dict[str, int]:
+        """خواندن شمارنده‌های StatsService که با pattern شروع می‌شوند"""
+        return parse_query_stats(await self._invoke(QUERY_STATS, build_query_stats(pattern, reset)))
+
+    async def close(self):
+        if self._channel is not None:
+            await self._channel.close()
+            self._channel = None
+
+# سرور stub برای تست
+
+class StubXrayServer:
+    """
+    شبیه‌ساز API هسته‌ی Xray روی یک پورت محلی
+
+    کاربران هر inbound در حافظه نگه داشته می‌شوند تا تست‌ها بتوانند نتیجه را بررسی کنند.
+    شمارنده‌های ترافیک با add_traffic افزایش داده می‌شوند.
+    """
+
+    def __init__(self, address: str = "127.0.0.1:0", delay: float = 0.0):
+        self.address = address
+        # تأخیر مصنوعی هر فراخوانی برای شبیه‌سازی نود دور
+        self.delay = delay
+        self.users: Dict[str, Dict[str, Dict[str, str]]] = {}
+        self.stats: Dict[str, int] = {}
+        self.calls = 0
+        self._server: Optional[grpc.aio.Server] = None
+
+    async def start(self) -> str:
+        self._server = grpc.aio.server()
+        self._server.add_generic_rpc_handlers(self._handlers())
+        port = self._server.add_insecure_port(self.address)
+        await self._server.start()
+        self.address = f"{self.address.rsplit(':', 1)[0]}:{port}"
+        return self.address
+
+    async def stop(self):
+        if self._server is not None:
+            await self._server.stop(None)
+            self._server = None
+
+    def add_traffic(self, email: str, uplink: int = 0, downlink: int = 0):
+        """شبیه‌سازی مصرف ترافیک یک کاربر"""
+        for direction, value in (("uplink", uplink), ("downlink", downlink)):
+            name = f"user>>>{email}>>>traffic>>>{direction}"
+            self.stats[name] = self.stats.get(name, 0) + value
+
+    def _handlers(self):
+        return (
+            grpc.method_handlers_generic_handler(HANDLER_SERVICE, {
+                "AlterInbound": grpc.unary_unary_rpc_method_handler(self._alter_inbound),
+            }),
+            grpc.method_handlers_generic_handler(STATS_SERVICE, {
+                "QueryStats": grpc.unary_unary_rpc_method_handler(self._query_stats),
+            }),
+        )
+
+    async def _alter_inbound(self, request: bytes, context) -> bytes:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        op = parse_alter_inbound(request)
+        users = self.users.setdefault(op["tag"], {})
+        if op["type"] == ADD_USER_TYPE:
+            if op["email"] in users:
+                await context.abort(grpc.StatusCode.UNKNOWN, f"User {op['email']} already exists.")
+            users[op["email"]] = {"id": op["uuid"], "flow": op["flow"]}
+        else:
+            if op["email"] not in users:
+                await context.abort(grpc.StatusCode.UNKNOWN, f"User {op['email']} not found.")
+            del users[op["email"]]
+        return b""
+
+    async def _query_stats(self, request: bytes, context) -> bytes:
+        self.calls += 1
+        fields = decode_message(request)
+        pattern = _first(fields, 1).decode()
+        reset = bool(_first(fields, 2, 0))
+        matched = {name: value for name, value in self.stats.items() if name.startswith(pattern)}
+        if reset:
+            for name in matched:
+                self.stats[name] = 0
+        return build_query_stats_response(matched)
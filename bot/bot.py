@@ -1,14 +1,25 @@
 import os
+import time
+import asyncio
 import logging
+import uuid
+from collections import OrderedDict
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
-import requests
+import httpx
 import json
 
 # تنظیمات
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 API_URL = "http://127.0.0.1:8000/api"
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "5"))
+API_RETRIES = int(os.getenv("API_RETRIES", "2"))
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "20"))
+# تعداد آپدیت‌هایی که هم‌زمان پردازش می‌شوند
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1000"))
 
 # لاگ
 logging.basicConfig(
@@ -16,33 +27,124 @@ logging.basicConfig(
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
+# لاگ هر درخواست httpx در سطح INFO فقط شلوغی ایجاد می‌کند
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # توابع کمکی API
-def api_request(method, endpoint, data=None):
-    """ارسال درخواست به API"""
-    url = f"{API_URL}{endpoint}"
-    try:
-        if method == "GET":
-            response = requests.get(url)
-        elif method == "POST":
-            response = requests.post(url, json=data)
-        elif method == "DELETE":
-            response = requests.delete(url)
-        
-        if response.status_code == 200:
-            return response.json()
-        return None
-    except Exception as e:
-        logger.error(f"API Error: {e}")
-        return None
-
-def get_user_by_telegram_id(telegram_id):
-    """دریافت اطلاعات کاربر از API"""
-    return api_request("GET", f"/users/{telegram_id}")
-
-def register_user(telegram_id, username=None, full_name=None):
+_client = None
+
+def get_api_client():
+    """کلاینت مشترک با اتصال‌های keep-alive به API"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=API_URL,
+            timeout=httpx.Timeout(API_TIMEOUT, connect=min(API_TIMEOUT, 2.0)),
+            limits=httpx.Limits(max_connections=API_MAX_CONNECTIONS,
+                                max_keepalive_connections=API_MAX_CONNECTIONS),
+        )
+    return _client
+
+async def close_api_client():
+    """بستن اتصال‌های باز هنگام خاموش شدن ربات"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def api_request(method, endpoint, data=None, idempotency_key=None, with_errors=False):
+    """
+    ارسال درخواست به API با تلاش دوباره
+
+    با idempotency_key درخواست‌های POST هم امن تکرار می‌شوند. با with_errors
+    پاسخ‌های 4xx به‌صورت {"success": False, "status", "detail"} برگردانده می‌شوند.
+    """
+    client = get_api_client()
+    # درخواست ارسال‌شده فقط وقتی دوباره امتحان می‌شود که تکرارش اثر دوباره نداشته باشد
+    retry_sent = method == "GET" or idempotency_key is not None
+    headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+    for attempt in range(API_RETRIES + 1):
+        last = attempt == API_RETRIES
+        try:
+            response = await client.request(method, endpoint, json=data, headers=headers)
+            if response.status_code >= 500 and retry_sent and not last:
+                error = f"HTTP {response.status_code}"
+            elif response.status_code == 200:
+                return response.json()
+            elif with_errors and 400 <= response.status_code < 500:
+                return {"success": False, "status": response.status_code,
+                        "detail": response.json().get("detail")}
+            else:
+                return None
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            # درخواست به سرور نرسیده؛ تکرار برای همه‌ی متدها امن است
+            error = e
+        except (httpx.TimeoutException, httpx.RemoteProtocolError) as e:
+            if not retry_sent:
+                logger.error(f"API Error: {e}")
+                return None
+            error = e
+        except Exception as e:
+            logger.error(f"API Error: {e}")
+            return None
+        if not last:
+            await asyncio.sleep(0.2 * 2 ** attempt)
+    logger.error(f"API Error: {error}")
+    return None
+
+class UserCache:
+    """کش TTL با حذف LRU برای اطلاعات کاربران، با شمارنده‌ی hit/miss"""
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None or item[0] < time.monotonic():
+            self._items.pop(key, None)
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key):
+        self._items.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self._items),
+        }
+
+user_cache = UserCache(USER_CACHE_TTL, USER_CACHE_SIZE)
+
+async def get_user_by_telegram_id(telegram_id):
+    """دریافت اطلاعات کاربر از کش یا API"""
+    user_info = user_cache.get(telegram_id)
+    if user_info is None:
+        user_info = await api_request("GET", f"/users/{telegram_id}")
+        if user_info:
+            user_cache.set(telegram_id, user_info)
+    return user_info
+
+async def register_user(telegram_id, username=None, full_name=None):
     """ثبت‌نام کاربر"""
-    return api_request("POST", "/users/register", {
+    user_cache.invalidate(telegram_id)
+    return await api_request("POST", "/users/register", {
         "telegram_id": telegram_id,
         "username": username,
         "full_name": full_name
@@ -55,7 +157,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = user.id
     
     # ثبت‌نام کاربر
-    register_user(telegram_id, user.username, user.full_name)
+    await register_user(telegram_id, user.username, user.full_name)
     
     welcome_text = """
 👋 به ربات Server24 خوش آمدید!
@@ -135,26 +237,39 @@ async def show_buy_menu(query, context):
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
+    # هر بار نمایش منو یک تلاش خرید جدید است؛ کلیدش فقط برای تکرار همین تلاش استفاده می‌شود
+    context.user_data["purchase_nonce"] = uuid.uuid4().hex
     await query.edit_message_text(text, reply_markup=reply_markup)
 
 async def handle_buy_action(query, context, data):
     """مدیریت خرید"""
-    user_info = get_user_by_telegram_id(query.from_user.id)
-    if not user_info:
-        await query.edit_message_text("❌ خطا در دریافت اطلاعات کاربر")
-        return
-    
     # استخراج حجم از callback_data
     gb_map = {"buy_10": 10, "buy_30": 30, "buy_50": 50, "buy_100": 100}
     gb = gb_map.get(data, 10)
-    price = gb * 5000  # قیمت هر گیگابایت
     
-    if user_info.get("balance", 0) < price:
+    # بررسی موجودی، کسر و ساخت کانفیگ در یک درخواست؛ کلیک‌های تکراری پیش از
+    # رسیدن پاسخ کلید یکسان دارند و فقط یک خرید ثبت می‌شود
+    nonce = context.user_data.setdefault("purchase_nonce", uuid.uuid4().hex)
+    idempotency_key = f"{query.from_user.id}:{nonce}:{data}"
+    result = await api_request("POST", "/purchases", {
+        "telegram_id": query.from_user.id,
+        "total_gb": gb,
+        "days": 30
+    }, idempotency_key=idempotency_key, with_errors=True)
+    if result is not None:
+        # پاسخ رسیده؛ خرید بعدی کلید جدید می‌گیرد. بدون پاسخ کلید برای تلاش دوباره می‌ماند
+        if context.user_data.get("purchase_nonce") == nonce:
+            del context.user_data["purchase_nonce"]
+    # کانفیگ‌ها و موجودی تغییر کرده‌اند
+    user_cache.invalidate(query.from_user.id)
+    
+    if result and result.get("status") == 402:
+        detail = result.get("detail") or {}
         text = f"""
 ❌ موجودی کافی نیست!
 
-موجودی فعلی: {user_info.get('balance', 0):,} تومان
-مبلغ مورد نیاز: {price:,} تومان
+موجودی فعلی: {detail.get('balance', 0):,} تومان
+مبلغ مورد نیاز: {detail.get('price', 0):,} تومان
 
 لطفاً ابتدا کیف پول خود را شارژ کنید.
 """
@@ -164,21 +279,8 @@ async def handle_buy_action(query, context, data):
         await query.edit_message_text(text, reply_markup=reply_markup)
         return
     
-    # ساخت کانفیگ
-    result = api_request("POST", "/configs/create", {
-        "user_id": user_info["id"],
-        "total_gb": gb,
-        "days": 30
-    })
-    
     if result and result.get("success"):
-        # کسر از موجودی
-        api_request("POST", "/wallet/add", {
-            "user_id": user_info["id"],
-            "amount": -price,
-            "description": f"خرید پلن {gb} گیگابایت"
-        })
-        
+        price = result["price"]
         text = f"""
 ✅ کانفیگ شما با موفقیت ساخته شد!
 
@@ -200,7 +302,7 @@ async def handle_buy_action(query, context, data):
 
 async def show_status(query, context):
     """نمایش وضعیت سرویس"""
-    user_info = get_user_by_telegram_id(query.from_user.id)
+    user_info = await get_user_by_telegram_id(query.from_user.id)
     if not user_info:
         await query.edit_message_text("❌ خطا در دریافت اطلاعات")
         return
@@ -230,6 +332,8 @@ async def show_status(query, context):
 • کل حجم: {total} GB
 • باقی‌مانده: {remaining} GB
 """
+        if user_info.get("subscription_url"):
+            text += f"\n🔗 لینک اشتراک (همه‌ی سرویس‌ها):\n{user_info['subscription_url']}\n"
     
     keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="back_main")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -237,7 +341,7 @@ async def show_status(query, context):
 
 async def show_profile(query, context):
     """نمایش پروفایل"""
-    user_info = get_user_by_telegram_id(query.from_user.id)
+    user_info = await get_user_by_telegram_id(query.from_user.id)
     if not user_info:
         await query.edit_message_text("❌ خطا در دریافت اطلاعات")
         return
@@ -257,7 +361,7 @@ async def show_profile(query, context):
 
 async def show_wallet(query, context):
     """نمایش کیف پول"""
-    user_info = get_user_by_telegram_id(query.from_user.id)
+    user_info = await get_user_by_telegram_id(query.from_user.id)
     if not user_info:
         await query.edit_message_text("❌ خطا در دریافت اطلاعات")
         return
@@ -308,6 +412,7 @@ async def show_admin_menu(query, context):
         [InlineKeyboardButton("👥 لیست کاربران", callback_data="admin_users")],
         [InlineKeyboardButton("📋 لیست کانفیگ‌ها", callback_data="admin_configs")],
         [InlineKeyboardButton("➕ ساخت کانفیگ", callback_data="admin_create")],
+        [InlineKeyboardButton("📈 آمار کش", callback_data="admin_cache")],
         [InlineKeyboardButton("🔙 بازگشت", callback_data="back_main")]
     ]
     
@@ -317,13 +422,14 @@ async def show_admin_menu(query, context):
 async def handle_admin_action(query, context, data):
     """مدیریت عملیات ادمین"""
     if data == "admin_users":
-        users = api_request("GET", "/admin/users")
-        if users:
+        page = await api_request("GET", "/admin/users?limit=10&fields=username,balance&include_total=true")
+        if page:
+            users = page["items"]
             text = "👥 لیست کاربران:\n\n"
-            for user in users[:10]:  # فقط 10 کاربر اول
-                text += f"• @{user.get('username', 'نامشخص')} - موجودی: {user.get('balance', 0):,} تومان\n"
-            if len(users) > 10:
-                text += f"\n... و {len(users) - 10} کاربر دیگر"
+            for user in users:
+                text += f"• @{user.get('username') or 'نامشخص'} - موجودی: {user.get('balance', 0):,} تومان\n"
+            if page["total"] > len(users):
+                text += f"\n... و {page['total'] - len(users)} کاربر دیگر"
         else:
             text = "❌ خطا در دریافت لیست کاربران"
         
@@ -332,29 +438,53 @@ async def handle_admin_action(query, context, data):
         await query.edit_message_text(text, reply_markup=reply_markup)
     
     elif data == "admin_configs":
-        configs = api_request("GET", "/admin/configs")
-        if configs:
-            text = f"📋 لیست کانفیگ‌ها:\n\nتعداد کل: {len(configs)}\n"
-            active = sum(1 for c in configs if c.get("is_active"))
-            text += f"فعال: {active}\nغیرفعال: {len(configs) - active}"
+        stats = await api_request("GET", "/admin/stats")
+        if stats:
+            configs = stats["configs"]
+            text = f"📋 لیست کانفیگ‌ها:\n\nتعداد کل: {configs['total']}\n"
+            text += f"فعال: {configs['active']}\nغیرفعال: {configs['total'] - configs['active']}\n"
+            text += f"انقضا تا {configs['expiring_days']} روز آینده: {configs['expiring']}"
         else:
             text = "❌ خطا در دریافت لیست کانفیگ‌ها"
         
         keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="admin")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(text, reply_markup=reply_markup)
+    
+    elif data == "admin_cache":
+        stats = user_cache.stats()
+        text = f"""📈 آمار کش کاربران:
+
+• hit: {stats['hits']}
+• miss: {stats['misses']}
+• نرخ hit: {stats['hit_rate']:.1%}
+• تعداد آیتم‌ها: {stats['size']} از {USER_CACHE_SIZE}
+• TTL: {USER_CACHE_TTL:g} ثانیه"""
+        api_stats = await api_request("GET", "/admin/cache")
+        if api_stats and api_stats["users"]["hit_rate"] is not None:
+            text += f"""
+
+📈 کش API کاربران ({api_stats['users']['backend']}):
+• hit: {api_stats['users']['hits']}
+• miss: {api_stats['users']['misses']}
+• نرخ hit: {api_stats['users']['hit_rate']:.1%}"""
+        
+        keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data="admin")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await query.edit_message_text(text, reply_markup=reply_markup)
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """مدیریت پیام‌های متنی"""
     if context.user_data.get("waiting_for_ticket"):
         # ایجاد تیکت
-        user_info = get_user_by_telegram_id(update.effective_user.id)
+        user_info = await get_user_by_telegram_id(update.effective_user.id)
         if user_info:
-            result = api_request("POST", "/tickets/create", {
+            result = await api_request("POST", "/tickets/create", {
                 "user_id": user_info["id"],
                 "subject": "تیکت پشتیبانی",
                 "message": update.message.text
             })
+            user_cache.invalidate(update.effective_user.id)
             
             if result and result.get("success"):
                 await update.message.reply_text("✅ تیکت شما با موفقیت ثبت شد. به زودی پاسخ داده می‌شود.")
@@ -363,6 +493,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         context.user_data["waiting_for_ticket"] = False
 
+async def on_shutdown(application):
+    """گزارش آمار کش و بستن کلاینت API"""
+    logger.info(f"آمار کش کاربران: {user_cache.stats()}")
+    await close_api_client()
 
 def main():
     """تابع اصلی"""
@@ -371,7 +505,13 @@ def main():
         return
     
     # ساخت اپلیکیشن
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     
     # اضافه کردن handlerها
     application.add_handler(CommandHandler("start", start))
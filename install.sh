@@ -73,7 +73,7 @@ apt-get install -y nginx
 
 # نصب پکیج‌های Python
 print_info "نصب پکیج‌های Python..."
-pip3 install fastapi uvicorn[standard] python-telegram-bot sqlalchemy aiofiles python-multipart jinja2
+pip3 install fastapi uvicorn[standard] python-telegram-bot sqlalchemy aiofiles python-multipart jinja2 grpcio aiosqlite brotli
 
 # قدم 3: نصب Xray-core
 print_info "نصب Xray-core..."
@@ -132,8 +132,31 @@ cat > /usr/local/etc/xray/config.json << 'EOF'
   "log": {
     "loglevel": "warning"
   },
+  "api": {
+    "tag": "api",
+    "services": ["HandlerService", "StatsService"]
+  },
+  "stats": {},
+  "policy": {
+    "levels": {
+      "0": {
+        "statsUserUplink": true,
+        "statsUserDownlink": true
+      }
+    }
+  },
   "inbounds": [
     {
+      "tag": "api",
+      "listen": "127.0.0.1",
+      "port": 10085,
+      "protocol": "dokodemo-door",
+      "settings": {
+        "address": "127.0.0.1"
+      }
+    },
+    {
+      "tag": "vless-in",
       "port": 443,
       "protocol": "vless",
       "settings": {
@@ -166,7 +189,16 @@ cat > /usr/local/etc/xray/config.json << 'EOF'
     {
       "protocol": "freedom"
     }
-  ]
+  ],
+  "routing": {
+    "rules": [
+      {
+        "type": "field",
+        "inboundTag": ["api"],
+        "outboundTag": "api"
+      }
+    ]
+  }
 }
 EOF
 
@@ -280,6 +312,9 @@ mkdir -p $PROJECT_DIR/database
 # دانلود فایل‌های backend
 print_info "دانلود فایل‌های backend..."
 curl -sL "$GITHUB_REPO/backend/main.py" -o $PROJECT_DIR/backend/main.py
+curl -sL "$GITHUB_REPO/backend/xray_api.py" -o $PROJECT_DIR/backend/xray_api.py
+curl -sL "$GITHUB_REPO/backend/static_assets.py" -o $PROJECT_DIR/backend/static_assets.py
+curl -sL "$GITHUB_REPO/backend/metrics.py" -o $PROJECT_DIR/backend/metrics.py
 curl -sL "$GITHUB_REPO/backend/requirements.txt" -o $PROJECT_DIR/backend/requirements.txt
 
 # دانلود فایل‌های bot
@@ -328,6 +363,9 @@ PROJECT_DIR=$PROJECT_DIR
 DATABASE_PATH=$PROJECT_DIR/database/server24.db
 XRAY_CONFIG_PATH=/usr/local/etc/xray/config.json
 FRONTEND_PATH=$PROJECT_DIR/frontend
+XRAY_PROVISIONER=api
+XRAY_API_ADDR=127.0.0.1:10085
+XRAY_INBOUND_TAG=vless-in
 EOF
 
 # تنظیم environment variables برای سرویس‌ها
@@ -402,10 +440,23 @@ server {
         proxy_set_header X-Forwarded-Proto \$scheme;
     }
 
+    # لینک‌های اشتراک /sub/{token} (مسیر کامل به API می‌رسد)
+    location /sub/ {
+        proxy_pass http://127.0.0.1:8000;
+        proxy_set_header Host \$host;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto \$scheme;
+    }
+
+    # صفحه‌ها، style.css و /static/ از بک‌اند سرو می‌شوند تا ETag، فشرده‌سازی و
+    # کش آدرس‌های هش‌دار StaticAssets اعمال شود
     location / {
-        root $PROJECT_DIR/frontend;
-        try_files \$uri \$uri/ /index.html;
-        index index.html;
+        proxy_pass http://127.0.0.1:8000;
+        proxy_set_header Host \$host;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto \$scheme;
     }
 
     location /vless {
@@ -468,10 +519,23 @@ server {
         proxy_set_header X-Forwarded-Proto \$scheme;
     }
 
+    # لینک‌های اشتراک /sub/{token} (مسیر کامل به API می‌رسد)
+    location /sub/ {
+        proxy_pass http://127.0.0.1:8000;
+        proxy_set_header Host \$host;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto \$scheme;
+    }
+
+    # صفحه‌ها، style.css و /static/ از بک‌اند سرو می‌شوند تا ETag، فشرده‌سازی و
+    # کش آدرس‌های هش‌دار StaticAssets اعمال شود
     location / {
-        root $PROJECT_DIR/frontend;
-        try_files \$uri \$uri/ /index.html;
-        index index.html;
+        proxy_pass http://127.0.0.1:8000;
+        proxy_set_header Host \$host;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto \$scheme;
     }
 
     location /vless {
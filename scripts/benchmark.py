@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+بنچمارک بک‌اند Server24
+یک دیتابیس SQLite موقت با داده‌ی نمونه ساخته می‌شود و مسیرهای پرتکرار
+روی اپ واقعی FastAPI اجرا می‌شوند؛ نتیجه به‌صورت JSON چاپ می‌شود.
+systemctl ساختگی و سرور stub gRPC جای Xray واقعی را می‌گیرند.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+# ایندکس‌هایی که پروفایل SQLite اضافه کرده؛ در حالت baseline بعد از شروع اپ حذف می‌شوند
+TUNED_INDEXES = ["ix_configs_user_id", "ix_wallet_user_created", "ix_wallet_user_id", "ix_tickets_user_created"]
+
+# مسیرهای پرتکرار برای suite؛ کانفیگ نمونه‌ی هر کاربر همان شناسه‌ی کاربر را دارد
+SUITE_ROUTES = {
+    "get_user": "GET /api/users/{telegram_id}",
+    "create_config": "POST /api/configs/create?user_id={user_id}",
+    "wallet_add": "POST /api/wallet/add?user_id={user_id}&amount=1000",
+    "admin_configs": "GET /api/admin/configs?limit=50&status=active",
+    "update_traffic": "POST /api/configs/{config_id}/update-traffic?used_gb=1.5",
+}
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 بر حسب میلی‌ثانیه"""
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 3)
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+def prepare_environment(workdir: str, tuned: bool = True):
+    """تنظیم متغیرهای محیطی تا هیچ سرویس واقعی لمس نشود"""
+    # systemctl ساختگی تا ری‌لود Xray واقعی انجام نشود
+    bin_dir = os.path.join(workdir, "bin")
+    os.makedirs(bin_dir)
+    with open(os.path.join(bin_dir, "systemctl"), "w") as f:
+        f.write("#!/bin/sh\nexit 0\n")
+    os.chmod(os.path.join(bin_dir, "systemctl"), 0o755)
+    xray_path = os.path.join(workdir, "xray.json")
+    with open(xray_path, "w") as f:
+        json.dump({"inbounds": [{"tag": "vless-in", "port": 443, "protocol": "vless",
+                                 "settings": {"clients": [], "decryption": "none"}}]}, f)
+    os.environ.update({
+        "DATABASE_PATH": os.path.join(workdir, "server24.db"),
+        "XRAY_CONFIG_PATH": xray_path,
+        "FRONTEND_PATH": os.path.join(workdir, "frontend"),
+        "XRAY_PROVISIONER": "file",
+        "XRAY_STATS_INTERVAL": "0",
+        "SQLITE_TUNING": "1" if tuned else "0",
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+    })
+    sys.path.insert(0, BACKEND_DIR)
+
+async def seed(main, users: int, wallet_rows: int):
+    """ساخت جداول و داده‌ی نمونه با درج گروهی"""
+    from sqlalchemy import text
+    await main.init_db()
+    # دفتر کیف پول با مانده‌ی جاری هر کاربر
+    balances = {}
+    wallet = []
+    for i in range(wallet_rows):
+        uid = random.randint(1, users)
+        balances[uid] = balances.get(uid, 0) + 1000
+        wallet.append({"uid": uid, "balance": balances[uid], "offset": f"-{wallet_rows - i} seconds"})
+    async with main.engine.begin() as conn:
+        await conn.execute(text("INSERT INTO users (id, telegram_id, username, balance, created_at, is_active, is_admin) "
+                          "VALUES (:id, :tid, :name, :balance, CURRENT_TIMESTAMP, 1, 0)"),
+                     [{"id": i, "tid": 100000 + i, "name": f"user{i}", "balance": balances.get(i, 0)}
+                      for i in range(1, users + 1)])
+        await conn.execute(text("INSERT INTO configs (user_id, uuid, port, total_gb, used_gb, expire_date, is_active, created_at) "
+                          "VALUES (:uid, :uuid, :port, 10, 0, '2099-01-01 00:00:00', 1, CURRENT_TIMESTAMP)"),
+                     [{"uid": i, "uuid": f"00000000-0000-0000-0000-{i:012d}", "port": 10000 + i} for i in range(1, users + 1)])
+        if wallet:
+            await conn.execute(text("INSERT INTO wallet (user_id, amount, balance_after, description, created_at) "
+                              "VALUES (:uid, 1000, :balance, 'seed', datetime('now', :offset))"), wallet)
+        # تخصیص‌دهنده‌ی پورت باید پورت‌های درج‌شده را ببیند
+        await conn.exec_driver_sql("DELETE FROM port_counter")
+        await conn.exec_driver_sql("DELETE FROM free_ports")
+    await main.init_port_allocator()
+    # اتصال‌های این event loop در loop بعدی قابل استفاده نیستند
+    await main.engine.dispose()
+
+def run_sqlite_profile(args) -> Dict:
+    """اجرای یک حالت (tuned یا baseline) در همین پردازه"""
+    workdir = tempfile.mkdtemp(prefix="server24-bench-")
+    prepare_environment(workdir, tuned=args.mode == "tuned")
+    import main
+    from fastapi.testclient import TestClient
+
+    asyncio.run(seed(main, args.users, args.users * args.wallet_per_user))
+
+    routes = {
+        "/api/users/{telegram_id}": lambda i: f"/api/users/{100000 + i}",
+        "/api/wallet/{user_id}/history": lambda i: f"/api/wallet/{i}/history",
+    }
+    result = {"mode": args.mode, "users": args.users, "routes": {}}
+    with TestClient(main.app) as client:
+        # init_db هنگام شروع ایندکس‌های ناموجود را می‌سازد، پس حذف باید بعد از آن باشد
+        with sqlite3.connect(os.environ["DATABASE_PATH"]) as conn:
+            if args.mode == "baseline":
+                for name in TUNED_INDEXES:
+                    conn.execute(f"DROP INDEX IF EXISTS {name}")
+            result["indexes"] = sorted(name for name, in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND name IN (%s)" % ",".join("?" * len(TUNED_INDEXES)),
+                TUNED_INDEXES
+            ))
+        for route, path in routes.items():
+            samples = []
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                response = client.get(path(random.randint(1, args.users)))
+                samples.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.text
+            result["routes"][route] = percentiles(samples)
+    return result
+
+def cmd_sqlite(args):
+    """مقایسه‌ی پروفایل SQLite با حالت پیش‌فرض، هر حالت در پردازه‌ی جدا"""
+    if args.mode:
+        print(json.dumps(run_sqlite_profile(args)))
+        return
+    results = {}
+    for mode in ("baseline", "tuned"):
+        output = subprocess.run(
+            [sys.executable, __file__, "sqlite", "--mode", mode, "--users", str(args.users),
+             "--requests", str(args.requests), "--wallet-per-user", str(args.wallet_per_user)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+    results["p99_speedup"] = {
+        route: round(results["baseline"]["routes"][route]["p99_ms"] / max(stats["p99_ms"], 1e-6), 2)
+        for route, stats in results["tuned"]["routes"].items()
+    }
+    print(json.dumps(results, indent=2))
+
+def fill_route(route: str, user: int) -> str:
+    return (route.replace("{telegram_id}", str(100000 + user))
+            .replace("{user_id}", str(user)).replace("{config_id}", str(user)))
+
+async def run_levels(client, route: str, users: int, requests: int, concurrency: List[int]) -> List[Dict]:
+    """اجرای یک مسیر در هر سطح هم‌زمانی؛ خطاهای HTTP شمرده می‌شوند"""
+    method, route = route.split(" ", 1) if " " in route else ("GET", route)
+    levels = []
+    for level in concurrency:
+        samples = []
+        errors = 0
+
+        async def worker(count: int):
+            nonlocal errors
+            for _ in range(count):
+                path = fill_route(route, random.randint(1, users))
+                started = time.perf_counter()
+                response = await client.request(method, path)
+                samples.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(requests // level) for _ in range(level)))
+        elapsed = time.perf_counter() - started
+        levels.append({
+            "concurrency": level,
+            "requests": len(samples),
+            "errors": errors,
+            "throughput_rps": round(len(samples) / elapsed, 1),
+            **percentiles(samples),
+        })
+    return levels
+
+def cmd_load(args):
+    """توان عملیاتی با سطوح مختلف هم‌زمانی روی یک event loop"""
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix="server24-bench-")
+    prepare_environment(workdir)
+    import main
+
+    async def run() -> Dict:
+        await seed(main, args.users, args.users * 2)
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                levels = await run_levels(client, args.route, args.users, args.requests, args.concurrency)
+        return {"route": args.route, "users": args.users, "levels": levels}
+
+    print(json.dumps(asyncio.run(run()), indent=2))
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old: Dict, new: Dict) -> Dict:
+    """نسبت توان عملیاتی و p99 نتیجه‌ی جدید به نتیجه‌ی قبلی برای هر مسیر و سطح"""
+    result = {}
+    for name, route in new["routes"].items():
+        previous = {level["concurrency"]: level for level in old.get("routes", {}).get(name, {}).get("levels", [])}
+        result[name] = [
+            {
+                "concurrency": level["concurrency"],
+                "throughput_ratio": round(level["throughput_rps"] / max(previous[level["concurrency"]]["throughput_rps"], 1e-6), 2),
+                "p99_ratio": round(level["p99_ms"] / max(previous[level["concurrency"]]["p99_ms"], 1e-6), 2),
+            }
+            for level in route["levels"] if level["concurrency"] in previous
+        ]
+    return result
+
+def cmd_suite(args):
+    """همه‌ی مسیرهای پرتکرار با Xray شبیه‌سازی‌شده (gRPC stub)؛ خروجی قابل مقایسه بین commitها"""
+    import httpx
+
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix="server24-bench-")
+    prepare_environment(workdir)
+    from xray_api import StubXrayServer
+
+    async def run() -> Dict:
+        stub = StubXrayServer()
+        os.environ.update({"XRAY_PROVISIONER": "api", "XRAY_API_ADDR": await stub.start()})
+        import main
+
+        await seed(main, args.users, args.users * args.wallet_per_user)
+        result = {
+            "meta": {
+                "commit": git_commit(),
+                "python": sys.version.split()[0],
+                "users": args.users,
+                "wallet_per_user": args.wallet_per_user,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "seed": args.seed,
+            },
+            "routes": {},
+        }
+        try:
+            async with main.lifespan(main.app):
+                transport = httpx.ASGITransport(app=main.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                    for name in args.routes:
+                        route = SUITE_ROUTES[name]
+                        levels = await run_levels(client, route, args.users, args.requests, args.concurrency)
+                        result["routes"][name] = {"route": route, "levels": levels}
+        finally:
+            await stub.stop()
+        result["meta"]["xray_calls"] = stub.calls
+        return result
+
+    result = asyncio.run(run())
+    if args.compare:
+        with open(args.compare) as f:
+            result["comparison"] = compare(json.load(f), result)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک بک‌اند Server24")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sqlite = sub.add_parser("sqlite", help="مقایسه‌ی p99 با و بدون پروفایل SQLite")
+    sqlite.add_argument("--users", type=int, default=20000)
+    sqlite.add_argument("--wallet-per-user", type=int, default=5)
+    sqlite.add_argument("--requests", type=int, default=500)
+    sqlite.add_argument("--mode", choices=["baseline", "tuned"], help=argparse.SUPPRESS)
+    sqlite.set_defaults(func=cmd_sqlite)
+
+    load = sub.add_parser("load", help="توان عملیاتی در سطوح مختلف هم‌زمانی")
+    load.add_argument("--route", default="/api/users/{telegram_id}",
+                      help='مثلاً "/api/users/{telegram_id}" یا "POST /api/configs/create?user_id={user_id}"')
+    load.add_argument("--users", type=int, default=5000)
+    load.add_argument("--requests", type=int, default=2000)
+    load.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 4, 16, 64])
+    load.set_defaults(func=cmd_load)
+
+    suite = sub.add_parser("suite", help="همه‌ی مسیرهای پرتکرار با خروجی JSON قابل مقایسه")
+    suite.add_argument("--users", type=int, default=5000)
+    suite.add_argument("--wallet-per-user", type=int, default=2)
+    suite.add_argument("--requests", type=int, default=1000, help="تعداد درخواست هر مسیر در هر سطح")
+    suite.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 16, 64])
+    suite.add_argument("--routes", type=lambda v: v.split(","), default=list(SUITE_ROUTES),
+                       help="زیرمجموعه‌ای از " + ",".join(SUITE_ROUTES))
+    suite.add_argument("--seed", type=int, default=24)
+    suite.add_argument("--output", help="ذخیره‌ی نتیجه در فایل")
+    suite.add_argument("--compare", help="فایل نتیجه‌ی قبلی برای مقایسه")
+    suite.set_defaults(func=cmd_suite)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
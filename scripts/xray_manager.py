@@ -4,13 +4,20 @@
 برای ساخت، حذف و به‌روزرسانی کانفیگ‌ها
 """
 
+import asyncio
 import json
 import os
 import sys
+import sqlite3
 import subprocess
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 XRAY_CONFIG_PATH = os.getenv("XRAY_CONFIG_PATH", "/usr/local/etc/xray/config.json")
+XRAY_PROVISIONER = os.getenv("XRAY_PROVISIONER", "file")
+XRAY_API_ADDR = os.getenv("XRAY_API_ADDR", "127.0.0.1:10085")
+XRAY_INBOUND_TAG = os.getenv("XRAY_INBOUND_TAG", "vless-in")
+# ایندکس کناری کلاینت‌ها (SQLite)
+XRAY_INDEX_PATH = os.getenv("XRAY_INDEX_PATH", f"{XRAY_CONFIG_PATH}.index")
 
 def load_config() -> Optional[Dict]:
     """بارگذاری کانفیگ Xray"""
@@ -21,11 +28,17 @@ def load_config() -> Optional[Dict]:
         print(f"خطا در بارگذاری کانفیگ: {e}")
         return None
 
+def write_config_text(text: str):
+    """نوشتن اتمیک کانفیگ با فایل موقت و rename؛ Xray هیچ‌وقت فایل نیمه‌کاره نمی‌بیند"""
+    tmp_path = f"{XRAY_CONFIG_PATH}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, XRAY_CONFIG_PATH)
+
 def save_config(config: Dict) -> bool:
     """ذخیره کانفیگ Xray"""
     try:
-        with open(XRAY_CONFIG_PATH, 'w') as f:
-            json.dump(config, f, indent=2)
+        write_config_text(json.dumps(config, separators=(",", ":")))
         return True
     except Exception as e:
         print(f"خطا در ذخیره کانفیگ: {e}")
@@ -40,78 +53,245 @@ def reload_xray() -> bool:
         print(f"خطا در ری‌لود Xray: {e}")
         return False
 
+def apply_live(op: str, clients: List[Tuple[str, str]]) -> bool:
+    """اعمال تغییرات روی Xray در حال اجرا از طریق API (بدون ری‌لود)"""
+    if XRAY_PROVISIONER != "api":
+        return False
+    if not clients:
+        return True
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+    from xray_api import XrayAPI, XrayAPIError
+
+    async def run():
+        api = XrayAPI(XRAY_API_ADDR)
+        try:
+            # دسته‌های کوچک تا هزاران فراخوانی هم‌زمان باز نشود
+            for start in range(0, len(clients), 100):
+                if op == "add":
+                    await asyncio.gather(*(api.add_user(XRAY_INBOUND_TAG, uuid, email=uuid, flow=flow)
+                                           for uuid, flow in clients[start:start + 100]))
+                else:
+                    await asyncio.gather(*(api.remove_user(XRAY_INBOUND_TAG, email=uuid)
+                                           for uuid, _ in clients[start:start + 100]))
+        finally:
+            await api.close()
+
+    try:
+        asyncio.run(run())
+        return True
+    except XrayAPIError as e:
+        print(f"خطا در API Xray، ری‌لود انجام می‌شود: {e}")
+        return False
+
+class XrayConfigStore:
+    """
+    کلاینت‌های inbound VLESS با ایندکس کناری SQLite
+
+    ایندکس (XRAY_INDEX_PATH) کلاینت‌ها را با کلید UUID و بقیه‌ی کانفیگ را به‌صورت
+    قالب نگه می‌دارد، پس بررسی وجود و لیست کردن بدون تجزیه‌ی فایل JSON انجام
+    می‌شود. اگر فایل کانفیگ بیرون از این اسکریپت تغییر کرده باشد (مثلاً توسط
+    بک‌اند)، ایندکس یک بار از روی فایل دوباره ساخته می‌شود. فایل کانفیگ فقط
+    وقتی چیزی واقعاً تغییر کند از روی ایندکس بازتولید می‌شود.
+    """
+
+    # جای لیست کلاینت‌ها در قالب
+    PLACEHOLDER = "__server24_clients__"
+
+    def __init__(self, config_path: str = XRAY_CONFIG_PATH, index_path: str = XRAY_INDEX_PATH):
+        self.config_path = config_path
+        self.db = sqlite3.connect(index_path)
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS clients (seq INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, data TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+        )
+
+    def close(self):
+        self.db.close()
+
+    def _file_stamp(self) -> str:
+        st = os.stat(self.config_path)
+        return f"{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def sync(self) -> bool:
+        """ساخت دوباره‌ی ایندکس اگر فایل کانفیگ از آخرین نوشتن تغییر کرده باشد"""
+        try:
+            stamp = self._file_stamp()
+        except OSError as e:
+            print(f"خطا در بارگذاری کانفیگ: {e}")
+            return False
+        if stamp == self._meta("stamp"):
+            return True
+        config = load_config()
+        if not config:
+            return False
+        clients = []
+        for inbound in config.get("inbounds", []):
+            if inbound.get("protocol") == "vless":
+                settings = inbound.setdefault("settings", {})
+                clients = settings.get("clients", [])
+                settings["clients"] = self.PLACEHOLDER
+                break
+        else:
+            print("inbound VLESS در کانفیگ یافت نشد")
+            return False
+        with self.db:
+            self.db.execute("DELETE FROM clients")
+            self.db.executemany(
+                "INSERT OR IGNORE INTO clients (id, data) VALUES (?, ?)",
+                [(c.get("id"), json.dumps(c, separators=(",", ":"))) for c in clients if c.get("id")]
+            )
+            self._set_meta("template", json.dumps(config, separators=(",", ":")))
+            self._set_meta("stamp", stamp)
+        return True
+
+    def contains(self, uuid: str) -> bool:
+        return self.db.execute("SELECT 1 FROM clients WHERE id = ?", (uuid,)).fetchone() is not None
+
+    def list_clients(self) -> List[Dict]:
+        return [json.loads(data) for data, in self.db.execute("SELECT data FROM clients ORDER BY seq")]
+
+    def list_ids(self) -> List[str]:
+        return [uuid for uuid, in self.db.execute("SELECT id FROM clients ORDER BY seq")]
+
+    def add_clients(self, clients: List[Tuple[str, str]]) -> Optional[List[Tuple[str, str]]]:
+        """افزودن کلاینت‌ها؛ UUIDهای تکراری نادیده گرفته می‌شوند. خروجی: اضافه‌شده‌ها یا None در خطا"""
+        if not self.sync():
+            return None
+        added = []
+        try:
+            with self.db:
+                for uuid, flow in clients:
+                    data = json.dumps({"id": uuid, "flow": flow, "email": uuid}, separators=(",", ":"))
+                    if self.db.execute("INSERT OR IGNORE INTO clients (id, data) VALUES (?, ?)", (uuid, data)).rowcount:
+                        added.append((uuid, flow))
+                if added:
+                    self._write()
+        except OSError as e:
+            print(f"خطا در ذخیره کانفیگ: {e}")
+            return None
+        return added
+
+    def remove_clients(self, uuids: List[str]) -> Optional[List[str]]:
+        """حذف کلاینت‌ها؛ خروجی: UUIDهایی که وجود داشتند یا None در خطا"""
+        if not self.sync():
+            return None
+        removed = []
+        try:
+            with self.db:
+                for uuid in uuids:
+                    if self.db.execute("DELETE FROM clients WHERE id = ?", (uuid,)).rowcount:
+                        removed.append(uuid)
+                if removed:
+                    self._write()
+        except OSError as e:
+            print(f"خطا در ذخیره کانفیگ: {e}")
+            return None
+        return removed
+
+    def _write(self):
+        """بازتولید فایل کانفیگ از قالب و ایندکس؛ داخل تراکنش ایندکس تا خطای نوشتن آن را برگرداند"""
+        datas = [data for data, in self.db.execute("SELECT data FROM clients ORDER BY seq")]
+        text = self._meta("template").replace(json.dumps(self.PLACEHOLDER), "[" + ",".join(datas) + "]", 1)
+        write_config_text(text)
+        self._set_meta("stamp", self._file_stamp())
+
+def _store_call(method: str, *args):
+    store = XrayConfigStore()
+    try:
+        return getattr(store, method)(*args)
+    finally:
+        store.close()
+
+def add_clients(clients: List[Tuple[str, str]]) -> Optional[List[Tuple[str, str]]]:
+    """افزودن گروهی با یک بار نوشتن و حداکثر یک ری‌لود؛ None یعنی خطا"""
+    added = _store_call("add_clients", clients)
+    if added:
+        # فایل برای ماندگاری ذخیره می‌شود؛ اگر API کار کرد ری‌لود لازم نیست
+        if not (apply_live("add", added) or reload_xray()):
+            return None
+    return added
+
+def remove_clients(uuids: List[str]) -> Optional[List[str]]:
+    """حذف گروهی با یک بار نوشتن و حداکثر یک ری‌لود؛ None یعنی خطا"""
+    removed = _store_call("remove_clients", uuids)
+    if removed:
+        if not (apply_live("remove", [(uuid, "") for uuid in removed]) or reload_xray()):
+            return None
+    return removed
+
 def add_client(uuid: str, flow: str = "") -> bool:
     """افزودن کلاینت جدید به کانفیگ"""
-    config = load_config()
-    if not config:
-        return False
-    
-    # پیدا کردن inbound مربوط به VLESS
-    for inbound in config.get("inbounds", []):
-        if inbound.get("protocol") == "vless":
-            clients = inbound.get("settings", {}).get("clients", [])
-            
-            # بررسی وجود UUID
-            if any(c.get("id") == uuid for c in clients):
-                print(f"UUID {uuid} از قبل وجود دارد")
-                return False
-            
-            clients.append({
-                "id": uuid,
-                "flow": flow
-            })
-            inbound["settings"]["clients"] = clients
-            break
-    
-    if save_config(config):
-        return reload_xray()
-    return False
+    added = add_clients([(uuid, flow)])
+    if added == []:
+        print(f"UUID {uuid} از قبل وجود دارد")
+    return bool(added)
 
 def remove_client(uuid: str) -> bool:
     """حذف کلاینت از کانفیگ"""
-    config = load_config()
-    if not config:
-        return False
-    
-    # پیدا کردن inbound مربوط به VLESS
-    for inbound in config.get("inbounds", []):
-        if inbound.get("protocol") == "vless":
-            clients = inbound.get("settings", {}).get("clients", [])
-            inbound["settings"]["clients"] = [c for c in clients if c.get("id") != uuid]
-            break
-    
-    if save_config(config):
-        return reload_xray()
-    return False
+    return remove_clients([uuid]) is not None
 
 def list_clients() -> List[Dict]:
     """لیست تمام کلاینت‌ها"""
-    config = load_config()
-    if not config:
-        return []
-    
-    clients = []
-    for inbound in config.get("inbounds", []):
-        if inbound.get("protocol") == "vless":
-            clients = inbound.get("settings", {}).get("clients", [])
-            break
-    
-    return clients
+    store = XrayConfigStore()
+    try:
+        return store.list_clients() if store.sync() else []
+    finally:
+        store.close()
 
-if __name__ == "__main__":
+def read_batch(path: str) -> List[Tuple[str, str]]:
+    """خواندن فایل دسته‌ای: هر خط «uuid [flow]»؛ خطوط خالی و # نادیده گرفته می‌شوند. - یعنی stdin"""
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        items = []
+        for line in f:
+            parts = line.split("#", 1)[0].split()
+            if parts:
+                items.append((parts[0], parts[1] if len(parts) > 1 else ""))
+        return items
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def usage():
+    print("استفاده:")
+    print("  python3 xray_manager.py add <uuid> [flow]")
+    print("  python3 xray_manager.py add --from-file <path|->     # هر خط: uuid [flow]")
+    print("  python3 xray_manager.py remove <uuid>")
+    print("  python3 xray_manager.py remove --from-file <path|->  # هر خط: uuid")
+    print("  python3 xray_manager.py list")
+    sys.exit(1)
+
+def main():
     if len(sys.argv) < 2:
-        print("استفاده:")
-        print("  python3 xray_manager.py add <uuid> [flow]")
-        print("  python3 xray_manager.py remove <uuid>")
-        print("  python3 xray_manager.py list")
-        sys.exit(1)
+        usage()
     
     command = sys.argv[1]
+    batch = len(sys.argv) > 2 and sys.argv[2] == "--from-file"
+    
+    if command in ("add", "remove") and len(sys.argv) < 3:
+        print("لطفاً UUID را وارد کنید")
+        sys.exit(1)
     
-    if command == "add":
-        if len(sys.argv) < 3:
-            print("لطفاً UUID را وارد کنید")
+    if batch and len(sys.argv) < 4:
+        print("مسیر فایل (یا - برای stdin) بعد از --from-file لازم است")
+        usage()
+    
+    if command == "add" and batch:
+        items = read_batch(sys.argv[3])
+        added = add_clients(items)
+        if added is None:
+            print("❌ خطا در افزودن کلاینت‌ها")
             sys.exit(1)
+        print(f"✅ {len(added)} کلاینت اضافه شد ({len(items) - len(added)} تکراری)")
+    
+    elif command == "add":
         uuid = sys.argv[2]
         flow = sys.argv[3] if len(sys.argv) > 3 else ""
         if add_client(uuid, flow):
@@ -119,10 +299,15 @@ if __name__ == "__main__":
         else:
             print(f"❌ خطا در افزودن کلاینت")
     
-    elif command == "remove":
-        if len(sys.argv) < 3:
-            print("لطفاً UUID را وارد کنید")
+    elif command == "remove" and batch:
+        uuids = [uuid for uuid, _ in read_batch(sys.argv[3])]
+        removed = remove_clients(uuids)
+        if removed is None:
+            print("❌ خطا در حذف کلاینت‌ها")
             sys.exit(1)
+        print(f"✅ {len(removed)} کلاینت حذف شد ({len(uuids) - len(removed)} یافت نشد)")
+    
+    elif command == "remove":
         uuid = sys.argv[2]
         if remove_client(uuid):
             print(f"✅ کلاینت {uuid} با موفقیت حذف شد")
@@ -130,12 +315,17 @@ if __name__ == "__main__":
             print(f"❌ خطا در حذف کلاینت")
     
     elif command == "list":
-        clients = list_clients()
-        print(f"تعداد کلاینت‌ها: {len(clients)}")
-        for client in clients:
-            print(f"  - {client.get('id')}")
+        store = XrayConfigStore()
+        try:
+            uuids = store.list_ids() if store.sync() else []
+        finally:
+            store.close()
+        print(f"تعداد کلاینت‌ها: {len(uuids)}")
+        print("".join(f"  - {uuid}\n" for uuid in uuids), end="")
     
     else:
         print("دستور نامعتبر")
         sys.exit(1)
 
+if __name__ == "__main__":
+    main()